@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Memory benchmark for file listings. Builds a synthetic siteapi/files.json with 500k entries
+and compares `json.loads` into a list of dicts (what `Glass.list_files` does) against
+streaming it into a `FileListing` (what `Glass.list_files_compact` does).
+
+    $> python benchmarks.py [entries]
+"""
+from glass.files import FileListing, iter_json_array
+import hashlib
+import json
+import sys
+import time
+import tracemalloc
+
+CHUNK_SIZE = 64 * 1024
+
+
+def synthetic_listing(entries):
+    records = (
+        {
+            "path": "uploads/{:03d}/asset-{}.jpg".format(i % 997, i),
+            "sha": hashlib.sha1(str(i).encode('ascii')).hexdigest(),
+            "size": i * 31 % 1000000,
+        }
+        for i in range(entries)
+    )
+    return ('[' + ','.join(json.dumps(r) for r in records) + ']').encode('utf-8')
+
+
+def measure(func):
+    # tracemalloc slows allocation down a lot, so time an untraced run separately.
+    start = time.time()
+    result = func()
+    elapsed = time.time() - start
+    del result
+
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def main(entries):
+    buffer = synthetic_listing(entries)
+    chunks = lambda: (buffer[i:i + CHUNK_SIZE] for i in range(0, len(buffer), CHUNK_SIZE))
+    sys.stdout.write('{} entries, {:.1f} MB of json\n'.format(entries, len(buffer) / 1e6))
+
+    def as_dicts():
+        files = json.loads(buffer.decode('utf-8'))
+        return files, set(f['path'] for f in files)
+
+    def as_listing():
+        return FileListing.from_records(iter_json_array(chunks()))
+
+    for name, func in (('list of dicts', as_dicts), ('FileListing', as_listing)):
+        result, current, peak, elapsed = measure(func)
+        sys.stdout.write('{:<14} retained {:7.1f} MB  peak {:7.1f} MB  {:5.2f}s\n'.format(
+            name, current / 1e6, peak / 1e6, elapsed))
+        del result
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -1,8 +1,10 @@
 from .client import Glass
+from .files import FileListing
+from .pages import PageIndex
 __title__ = 'glass-cli'
 __version__ = '0.9.2a6'
 __build__ = 0x000904
 __author__ = 'Servee LLC - Issac Kelly'
 __license__ = 'Apache 2.0'
 __copyright__ = 'Copyright 2016 Servee LLC'
-__all__ = [Glass]
+__all__ = [Glass, FileListing, PageIndex]
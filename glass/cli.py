@@ -4,6 +4,7 @@ from sys import exit
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 from glass.client import Glass
+from glass.optimize import Optimizer
 from glass import __version__, __build__
 import logging
 import requests
@@ -94,6 +95,9 @@ def cli(ctx, debug):
         click.echo('    sync')
         click.echo('    watch')
         click.echo('    put_all')
+        click.echo('    pages')
+        click.echo('    snapshot')
+        click.echo('    restore')
         click.echo('')
 
     click.echo('Debug mode is %s' % ('on' if debug else 'off'))
@@ -200,15 +204,15 @@ def get_file(ctx, remote_path, remote_context=None):
 def get_all(ctx):
     glass = ctx.obj['glass']
 
-    remote_files = glass.list_files()
+    remote_files = glass.list_files_compact()
     glass.load_ignore()
-    ignore_remote = set(glass.ignore_spec.match_files([f['path'] for f in remote_files]))
+    ignore_remote = set(glass.ignore_spec.match_files(remote_files))
 
-    for f in remote_files:
-        if f['path'] in ignore_remote:
-            click.echo("Skipping {} - ignored.".format(f["path"]))
+    for path in remote_files:
+        if path in ignore_remote:
+            click.echo("Skipping {} - ignored.".format(path))
             continue
-        ctx.invoke(get_file, f["path"], f)
+        ctx.invoke(get_file, path, remote_files.get(path))
 
 
 @cli.command()
@@ -216,28 +220,41 @@ def get_all(ctx):
 def put_file(ctx, local_path):
     remote_path = local_path.replace("\\", '/')
     glass = ctx.obj['glass']
+    content_type = mimetypes.guess_type(local_path)[0]
     click.echo('Putting File: {}'.format(remote_path))
+
+    optimizer = ctx.obj.get('optimizer')
+    if optimizer and content_type:
+        buffer = optimizer.process(local_path, content_type)
+        if buffer is not None:
+            glass.put_file(remote_path, buffer, content_type)
+            return
+
     with open(local_path, 'rb') as fb:
-        glass.put_file(remote_path, fb, mimetypes.guess_type(local_path)[0])
+        glass.put_file(remote_path, fb, content_type)
 
 
 
 @cli.command()
+@click.option('--optimize/--no-optimize', default=False, help='Minify and optimize assets before uploading.')
 @click.pass_context
-def put_all(ctx):
+def put_all(ctx, optimize):
     glass = ctx.obj['glass']
+    if optimize:
+        ctx.obj['optimizer'] = Optimizer(glass.config_path)
 
-    remote_files = glass.list_files()
+    remote_files = glass.list_files_compact()
     glass.load_ignore()
     local_files = set([os.path.join(dp[2:], f) for dp, dn, filenames in os.walk('.') for f in filenames if not dn])
 
     ignore_local_files = set(glass.ignore_spec.match_tree('.'))
 
+    optimizer = ctx.obj.get('optimizer')
+    if optimizer:
+        optimizer.prune(local_files - ignore_local_files)
+
     for f in sorted(local_files - ignore_local_files):
-        rf = {}
-        for rf in remote_files:
-            if f == rf['path']:
-                break
+        rf = remote_files.get(f, {})
         #TODO
         #
         # if rf:
@@ -246,6 +263,60 @@ def put_all(ctx):
         ctx.invoke(put_file, f)
 
 
+@cli.command()
+@click.argument('url', default='')
+@click.option('--refresh/--no-refresh', default=False, help='Download the page tree again instead of using .glass/pages.json.')
+@click.pass_context
+def pages(ctx, url, refresh):
+    """
+    Lists the pages below URL.
+    """
+    glass = ctx.obj['glass']
+    index = glass.load_page_index(refresh=refresh)
+    for page in index.subtree(url):
+        click.echo(page['url'])
+
+
+@cli.command()
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.pass_context
+def snapshot(ctx, path):
+    """
+    Saves every file, page, data record and the settings for the site to a single archive.
+    """
+    from glass.snapshot import snapshot as snapshot_site
+
+    glass = ctx.obj['glass']
+    finished = False
+    try:
+        with open(path, 'wb') as fb:
+            index = snapshot_site(glass, fb, echo=click.echo)
+        finished = True
+    finally:
+        # Don't leave an incomplete backup lying around looking like a good one, even on Ctrl-C.
+        if not finished:
+            os.remove(path)
+    click.echo('Wrote {} files, {} pages and {} data records to {}'.format(
+        len(index['files']), len(index['pages']), len(index['data']), path))
+
+
+@cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', default=8, help='Number of concurrent uploads.')
+@click.pass_context
+def restore(ctx, path, workers):
+    """
+    Replays an archive made by `glass snapshot` onto the site.
+    """
+    from glass.snapshot import restore as restore_site
+
+    glass = ctx.obj['glass']
+    failures = restore_site(glass, path, workers=workers, echo=click.echo)
+    if failures:
+        click.echo('Failed to restore: {}'.format(', '.join(str(f) for f in failures)))
+        exit(1)
+
+
 class FSEventHandler(FileSystemEventHandler):
 
     def __init__(self, ctx, *args, **kwargs):
@@ -272,9 +343,12 @@ class FSEventHandler(FileSystemEventHandler):
 
 
 @cli.command()
+@click.option('--optimize/--no-optimize', default=False, help='Minify and optimize assets before uploading.')
 @click.pass_context
-def watch(ctx):
+def watch(ctx, optimize):
     path = '.'
+    if optimize:
+        ctx.obj['optimizer'] = Optimizer(ctx.obj['glass'].config_path)
     observer = Observer()
     event_handler = FSEventHandler(ctx)
     observer.schedule(event_handler, path, recursive=True)
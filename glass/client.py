@@ -4,6 +4,8 @@ import os, os.path, json, re
 import pathspec
 from pathspec.gitignore import GitIgnorePattern
 import logging
+from .files import FileListing, iter_json_array
+from .pages import PageIndex
 
 try:
     from json.decoder import JSONDecodeError
@@ -15,6 +17,10 @@ logger = logging.getLogger()
 class Glass(object):
 
     spec = None
+    page_index = None
+    # When set, site_req raises requests.HTTPError for non 200/201 responses instead of
+    # logging and carrying on.
+    raise_errors = False
 
     def __init__(self, email, password, domain=None, glass_url=None, config_path=None, **kwargs):
         self.email = email
@@ -70,16 +76,24 @@ class Glass(object):
             logger.error('Error returning json response', exc_info=True)
 
     def site_req(self, path, method="GET", auth=True, **kwargs):
-        response = requests.request(
+        return self._response_json(self._site_response(path, method, auth, **kwargs), path)
+
+    def _site_response(self, path, method="GET", auth=True, **kwargs):
+        return requests.request(
             method,
             "{}{}".format(self.site["url"], path),
             auth=(self.email, self.password) if auth else None,
             **kwargs
         )
+
+    def _response_json(self, response, path):
         try:
             assert response.status_code in [200, 201]
         except AssertionError:
             logger.error('Non 200 response', exc_info=True)
+            if self.raise_errors:
+                raise requests.HTTPError(
+                    '{} response for {}'.format(response.status_code, path), response=response)
 
         try:
             return response.json()
@@ -98,6 +112,29 @@ class Glass(object):
     def list_files(self):
         return self.site_req('siteapi/files.json')
 
+    def iter_files(self, chunk_size=64 * 1024):
+        """
+        Streams `siteapi/files.json`, yielding each file record as it is parsed, so the whole
+        listing is never held in memory. Raises requests.HTTPError for a bad response and
+        ValueError if the listing is malformed or cut short.
+        """
+        response = self._site_response('siteapi/files.json', stream=True)
+        try:
+            if response.status_code != 200:
+                raise requests.HTTPError(
+                    '{} response for siteapi/files.json'.format(response.status_code), response=response)
+            for record in iter_json_array(response.iter_content(chunk_size=chunk_size)):
+                yield record
+        finally:
+            response.close()
+
+    def list_files_compact(self):
+        """
+        Same files as `list_files`, as a `FileListing`, which takes far less memory for sites
+        with a lot of files.
+        """
+        return FileListing.from_records(self.iter_files())
+
     def put_file(self, path, buffer, content_type="text/plain"):
         new_path = os.path.dirname(path)
         new_file = os.path.basename(path)
@@ -124,9 +161,10 @@ class Glass(object):
             "{}{}".format(self.site["url"], path),
         ).content
 
-    def get_site_resource(self, path):
+    def get_site_resource(self, path, **kwargs):
         return requests.get(
             "{}{}".format(self.site["url"], path),
+            **kwargs
         )
 
     def list_pages(self):
@@ -163,13 +201,24 @@ class Glass(object):
         if published:
             page_data['published'] = published.isoformat()
 
-        return self.site_req('siteapi/new_page', "POST", data=page_data)
+        response = self._site_response('siteapi/new_page', "POST", data=page_data)
+        resp = self._response_json(response, 'siteapi/new_page')
+        if response.status_code in [200, 201]:
+            if isinstance(resp, dict) and resp.get('url'):
+                self._page_changed(resp['url'], resp)
+            else:
+                self._page_changed(url, dict(page_data, content=content))
+        return resp
 
     def get_page(self, path):
         return self.site_req(path + '.json')
 
     def put_page(self, path, data):
-        return self.site_req(path + '.json', "POST", json=data)
+        response = self._site_response(path + '.json', "POST", json=data)
+        resp = self._response_json(response, path + '.json')
+        if response.status_code in [200, 201]:
+            self._page_changed(path, data)
+        return resp
 
     def query_data(self, **kwargs):
         """
@@ -190,6 +239,49 @@ class Glass(object):
     def create_data(self, id, data):
         return self.site_req('siteapi/data/new.json'.format(id), 'post', json=data)
 
+    def page_index_path(self):
+        if self.config_path:
+            return os.path.join(self.config_path, ".glass", "pages.json")
+
+    def load_page_index(self, refresh=False):
+        """
+        Loads the page tree into `self.page_index`, from .glass/pages.json if it has been saved
+        before, otherwise from `list_pages`. After this, `new_page` and `put_page` keep the index
+        and .glass/pages.json up to date. Without a loaded index they delete .glass/pages.json
+        instead, so the next load fetches a fresh tree.
+        """
+        path = self.page_index_path()
+        if path and not refresh:
+            try:
+                self.page_index = PageIndex.load(path)
+                return self.page_index
+            except (IOError, ValueError):
+                pass
+
+        self.page_index = PageIndex(self.list_pages() or [])
+        self.save_page_index()
+        return self.page_index
+
+    def save_page_index(self):
+        path = self.page_index_path()
+        if path and self.page_index is not None and os.path.exists(os.path.dirname(path)):
+            self.page_index.save(path)
+
+    def clear_page_index(self):
+        path = self.page_index_path()
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _page_changed(self, url, data):
+        if self.page_index is None:
+            self.clear_page_index()
+        else:
+            self.page_index.update(url, data)
+            self.save_page_index()
+
     def load_ignore(self):
         """
         For local development, loads .glass/ignore (same format as gitignore) to exclude files
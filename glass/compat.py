@@ -0,0 +1,15 @@
+import os
+
+try:
+    from os import replace
+except ImportError: # py2, py3.2
+    def replace(src, dst):
+        # os.rename won't overwrite an existing file on Windows.
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
@@ -0,0 +1,166 @@
+import binascii, codecs, json
+from array import array
+
+SHA_SIZE = 20
+
+try:
+    array('q')
+    SIZE_TYPECODE = 'q'
+except ValueError: # py2 has no long long arrays
+    SIZE_TYPECODE = 'l'
+_whitespace = ' \t\n\r'
+
+
+def iter_json_array(chunks):
+    """
+    Incrementally parses a JSON array of objects from an iterable of byte chunks (e.g.
+    `response.iter_content()`), yielding each item as soon as it is complete. Only one item
+    and one chunk are held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    # What may come next: '[' to open the array, an item or ']' straight after it, an item
+    # after a comma, or a comma or ']' after an item.
+    expect = 'open'
+
+    chunks = iter(chunks)
+    final = False
+    while not final:
+        try:
+            chunk = text_decoder.decode(next(chunks))
+        except StopIteration:
+            chunk = text_decoder.decode(b'', final=True)
+            final = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+        while True:
+            while pos < len(buf) and buf[pos] in _whitespace:
+                pos += 1
+            if pos >= len(buf):
+                break
+            char = buf[pos]
+
+            if expect == 'open':
+                if char != '[':
+                    raise ValueError('Expected a JSON array at position {}'.format(pos))
+                expect = 'first'
+                pos += 1
+                continue
+
+            if expect == 'separator':
+                if char == ',':
+                    expect = 'item'
+                    pos += 1
+                    continue
+                if char == ']':
+                    return
+                raise ValueError("Expected ',' or ']' but found {!r}".format(char))
+
+            if char == ']' and expect == 'first':
+                return
+            if char in ',]':
+                raise ValueError('Expected an item but found {!r}'.format(char))
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if final:
+                    raise
+                break
+            # Something has to follow every item, otherwise it may have been cut off mid-chunk.
+            if end >= len(buf) and not final:
+                break
+            yield item
+            pos = end
+            expect = 'separator'
+
+    raise ValueError('Unterminated JSON array')
+
+
+class FileListing(object):
+    """
+    Compact listing of a site's files: path, sha and size are kept in parallel arrays
+    instead of one dict per file, with a path -> position dict for O(1) lookups.
+
+    Iterating yields paths. `get` returns a dict shaped like a `Glass.list_files` record.
+    """
+
+    __slots__ = ('positions', 'shas', 'sizes', 'other_shas')
+
+    def __init__(self):
+        self.positions = {}
+        self.shas = bytearray()
+        self.sizes = array(SIZE_TYPECODE)
+        # Anything that isn't a 40 character hex sha (including missing ones) lives here.
+        self.other_shas = {}
+
+    @classmethod
+    def from_records(cls, records):
+        listing = cls()
+        for record in records:
+            listing.add(record['path'], record.get('sha'), record.get('size'))
+        return listing
+
+    def add(self, path, sha=None, size=None):
+        try:
+            packed = binascii.unhexlify(sha)
+        except (TypeError, ValueError):
+            packed = None
+        if packed is None or len(packed) != SHA_SIZE:
+            packed = None
+        size = -1 if size is None else int(size)
+
+        position = self.positions.get(path)
+        if position is None:
+            position = self.positions[path] = len(self.sizes)
+            self.shas.extend(packed or b'\0' * SHA_SIZE)
+            self.sizes.append(size)
+        else:
+            self.other_shas.pop(position, None)
+            if packed:
+                self.shas[position * SHA_SIZE:(position + 1) * SHA_SIZE] = packed
+            self.sizes[position] = size
+
+        if packed is None:
+            self.other_shas[position] = sha
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __contains__(self, path):
+        return path in self.positions
+
+    def _sha(self, position):
+        if position in self.other_shas:
+            return self.other_shas[position]
+        start = position * SHA_SIZE
+        return binascii.hexlify(bytes(self.shas[start:start + SHA_SIZE])).decode('ascii')
+
+    def sha(self, path):
+        position = self.positions.get(path)
+        if position is not None:
+            return self._sha(position)
+
+    def size(self, path):
+        position = self.positions.get(path)
+        if position is not None and self.sizes[position] >= 0:
+            return self.sizes[position]
+
+    def get(self, path, default=None):
+        position = self.positions.get(path)
+        if position is None:
+            return default
+        record = {"path": path, "sha": self._sha(position)}
+        if self.sizes[position] >= 0:
+            record["size"] = self.sizes[position]
+        return record
+
+    def records(self):
+        for path in self.positions:
+            yield self.get(path)
@@ -0,0 +1,206 @@
+import os, os.path, hashlib, re, io, shutil
+import logging
+from .compat import replace
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import PIL
+    from PIL import Image
+except ImportError:
+    PIL = Image = None
+
+logger = logging.getLogger()
+
+# content_type -> callable(bytes) -> bytes
+PROCESSORS = {}
+
+
+def register(*content_types):
+    """
+    Decorator to register a processor for one or more content types. A processor takes the
+    source bytes and returns the bytes that should be uploaded instead, or None to skip the
+    file. Set a `version` attribute on the processor to invalidate results cached by an
+    older version.
+
+        @register('text/html')
+        def strip_html(buffer):
+            ...
+    """
+    def _register(func):
+        for content_type in content_types:
+            PROCESSORS[content_type] = func
+        return func
+    return _register
+
+
+_css_tokens = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)''', re.DOTALL)
+_css_punctuation = re.compile(r'\s*([{};,>])\s*|(:)\s+')
+
+
+@register('text/css')
+def minify_css(buffer):
+    """
+    Uses rcssmin when it is installed, otherwise strips comments and collapses whitespace
+    outside of strings.
+    """
+    text = buffer.decode('utf-8')
+    if rcssmin is not None:
+        return rcssmin.cssmin(text).encode('utf-8')
+
+    parts = []
+    strings = []
+    pos = 0
+    for match in _css_tokens.finditer(text):
+        parts.append(text[pos:match.start()])
+        pos = match.end()
+        string, comment, space = match.groups()
+        if string:
+            # Park strings so the punctuation pass can't touch them.
+            parts.append('\x00{}\x00'.format(len(strings)))
+            strings.append(string)
+        elif comment and comment.startswith('/*!'):
+            parts.append(comment)
+        elif space or comment:
+            parts.append(' ')
+    parts.append(text[pos:])
+
+    text = _css_punctuation.sub(lambda m: m.group(1) or m.group(2), ''.join(parts)).replace(';}', '}').strip()
+    text = re.sub('\x00(\\d+)\x00', lambda m: strings[int(m.group(1))], text)
+    return text.encode('utf-8')
+
+
+@register('application/javascript', 'text/javascript', 'application/x-javascript')
+def minify_js(buffer):
+    """
+    JavaScript can't be minified safely with a few regexes, so this only runs when rjsmin
+    is installed.
+    """
+    if rjsmin is None:
+        return None
+    return rjsmin.jsmin(buffer.decode('utf-8')).encode('utf-8')
+
+
+@register('image/png')
+def optimize_png(buffer):
+    """
+    Lossless re-encode with Pillow, when it is installed. Animated PNGs are skipped, because
+    Pillow would only keep the first frame, and so are 16-bit PNGs, which Pillow reads as
+    8 bits per channel.
+    """
+    if Image is None:
+        return None
+    # Bit depth is the first byte after the signature, IHDR chunk header, width and height.
+    if len(buffer) > 24 and bytearray(buffer[24:25])[0] > 8:
+        return None
+    image = Image.open(io.BytesIO(buffer))
+    if getattr(image, 'n_frames', 1) > 1:
+        return None
+    out = io.BytesIO()
+    image.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+def _library_version(module):
+    if module is None:
+        return 'missing'
+    return '{} {}'.format(module.__name__, getattr(module, '__version__', ''))
+
+
+# Part of the cache key, so installing or upgrading a library invalidates cached results.
+minify_css.version = _library_version(rcssmin)
+minify_js.version = _library_version(rjsmin)
+optimize_png.version = '2 ' + _library_version(PIL)
+
+
+class Optimizer(object):
+    """
+    Runs registered processors over files before they are uploaded. Results are cached in
+    .glass/optimized by the sha1 of the source and the processor, so unchanged files are never
+    reprocessed. Only the latest result for each path is kept, `prune` drops paths that no longer
+    exist, and .glass/optimized can be deleted at any time to clear the cache entirely.
+    """
+
+    def __init__(self, config_path, processors=None):
+        self.cache_path = os.path.join(config_path, '.glass', 'optimized')
+        self.processors = PROCESSORS if processors is None else processors
+
+    def process(self, local_path, content_type):
+        """
+        Returns the bytes to upload for `local_path`, or None if the source file should be
+        uploaded unchanged.
+        """
+        func = self.processors.get(content_type)
+        if func is None:
+            return None
+
+        with open(local_path, 'rb') as fb:
+            buffer = fb.read()
+
+        content_sha = hashlib.sha1()
+        for part in (content_type, func.__module__, func.__name__, str(getattr(func, 'version', ''))):
+            content_sha.update(part.encode('utf-8'))
+            content_sha.update(b'\0')
+        content_sha.update(buffer)
+
+        path_dir = self._path_dir(local_path)
+        cached = os.path.join(path_dir, content_sha.hexdigest())
+
+        if os.path.exists(cached + '.noop'):
+            return None
+        try:
+            with open(cached, 'rb') as fb:
+                return fb.read()
+        except IOError:
+            pass
+
+        try:
+            result = func(buffer)
+        except Exception:
+            logger.error('Error optimizing {}'.format(local_path), exc_info=True)
+            return None
+
+        # The processor skipped this file (e.g. its library isn't installed), so there is
+        # nothing worth remembering.
+        if result is None:
+            return None
+
+        if not os.path.exists(path_dir):
+            os.makedirs(path_dir)
+        for name in os.listdir(path_dir):
+            try:
+                os.remove(os.path.join(path_dir, name))
+            except OSError:
+                pass
+
+        if len(result) >= len(buffer):
+            open(cached + '.noop', 'wb').close()
+            return None
+
+        # Write then rename, so a concurrent watch event never reads a partial file.
+        with open(cached + '.tmp', 'wb') as fb:
+            fb.write(result)
+        replace(cached + '.tmp', cached)
+        return result
+
+    def _path_dir(self, local_path):
+        return os.path.join(self.cache_path, hashlib.sha1(local_path.encode('utf-8')).hexdigest())
+
+    def prune(self, local_paths):
+        """
+        Removes cached results for every path not in `local_paths`.
+        """
+        if not os.path.exists(self.cache_path):
+            return
+        keep = set(os.path.basename(self._path_dir(p)) for p in local_paths)
+        for name in os.listdir(self.cache_path):
+            if name not in keep:
+                shutil.rmtree(os.path.join(self.cache_path, name), ignore_errors=True)
@@ -0,0 +1,239 @@
+import os, os.path, json, tempfile, threading
+from .compat import replace, string_types
+
+
+def _segments(url):
+    url = url.strip('/')
+    return url.split('/') if url else []
+
+
+def _declared_parent(page):
+    parent = page.get('parent')
+    if isinstance(parent, string_types):
+        parent = parent.strip('/')
+        # A page naming itself as its parent falls back to its url.
+        if parent and parent != page.get('url', '').strip('/'):
+            return parent
+
+
+class _Node(object):
+    __slots__ = ('children', 'path', 'url')
+
+    def __init__(self, path):
+        self.children = {}
+        self.path = path
+        # Set when there is a page at this path.
+        self.url = None
+
+
+class PageIndex(object):
+    """
+    Index over the pages returned by `Glass.list_pages`, for looking pages up by url and
+    walking the children of a section without re-fetching and scanning the whole list.
+
+    A page's parent is the page named in its `parent` field, when it has one, and otherwise
+    the nearest page above it by url. Urls are compared without leading or trailing slashes,
+    so "blog", "/blog/" and "blog/" are the same page.
+    """
+
+    def __init__(self, pages=()):
+        self.pages = {}
+        self.root = _Node('')
+        # parent url -> urls of the pages that name it in their `parent` field
+        self.declared = {}
+        # Glass.new_page and put_page may update the index from several threads at once.
+        self.lock = threading.RLock()
+        for page in pages:
+            self.add(page)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __iter__(self):
+        return iter(list(self.pages.values()))
+
+    def __contains__(self, url):
+        return url.strip('/') in self.pages
+
+    def _node(self, url, create=False):
+        node = self.root
+        for segment in _segments(url):
+            child = node.children.get(segment)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[segment] = _Node(
+                    segment if node is self.root else node.path + '/' + segment)
+            node = child
+        return node
+
+    def _url_children(self, node):
+        """
+        Keys of the nearest pages below `node` by url that don't name another parent, plus
+        pages naming a parent path in between that has no page of its own.
+        """
+        result = []
+        stack = list(node.children.values())
+        while stack:
+            node = stack.pop()
+            if node.url is None:
+                stack.extend(node.children.values())
+                result.extend(self.declared.get(node.path, ()))
+            elif _declared_parent(self.pages[node.url]) is None:
+                result.append(node.url)
+        return result
+
+    def _child_keys(self, key):
+        node = self._node(key)
+        keys = self._url_children(node) if node is not None else []
+        return keys + sorted(self.declared.get(key, ()))
+
+    def _unlink(self, key):
+        parent = _declared_parent(self.pages.get(key, {}))
+        if parent is not None:
+            self.declared.get(parent, set()).discard(key)
+
+    def add(self, page):
+        """
+        Adds a page, or replaces the page with the same url.
+        """
+        key = page['url'].strip('/')
+        with self.lock:
+            self._unlink(key)
+            self.pages[key] = page
+            self._node(key, create=True).url = key
+            parent = _declared_parent(page)
+            if parent is not None:
+                self.declared.setdefault(parent, set()).add(key)
+                self._node(parent, create=True)
+
+    def update(self, url, data):
+        """
+        Merges `data` into the indexed page at `url`, adding it if it isn't indexed yet.
+        """
+        with self.lock:
+            page = dict(self.get(url) or {"url": url})
+            page.update(data)
+            page['url'] = url
+            self.add(page)
+
+    def remove(self, url):
+        key = url.strip('/')
+        with self.lock:
+            self._unlink(key)
+            self.pages.pop(key, None)
+            node = self._node(key)
+            if node is not None:
+                node.url = None
+
+    def get(self, url):
+        return self.pages.get(url.strip('/'))
+
+    def parent(self, url):
+        """
+        Returns the parent page of `url`, or None.
+        """
+        key = url.strip('/')
+        page = self.pages.get(key)
+        declared = _declared_parent(page) if page else None
+        if declared is not None:
+            # The named parent may not be a page itself; fall back to the nearest one above it.
+            segments = _segments(declared)
+            if '/'.join(segments) in self.pages:
+                return self.pages['/'.join(segments)]
+        else:
+            segments = _segments(key)
+
+        while segments:
+            segments.pop()
+            page = self.pages.get('/'.join(segments))
+            if page is not None:
+                return page
+        return None
+
+    def depth(self, url):
+        """
+        Number of pages above `url`.
+        """
+        depth = 0
+        seen = set([url.strip('/')])
+        parent = self.parent(url)
+        while parent is not None and parent['url'].strip('/') not in seen:
+            depth += 1
+            seen.add(parent['url'].strip('/'))
+            parent = self.parent(parent['url'])
+        return depth
+
+    def children(self, url):
+        """
+        Returns the pages whose parent is `url`.
+        """
+        with self.lock:
+            return sorted((self.pages[k] for k in self._child_keys(url.strip('/'))),
+                          key=lambda p: p['url'])
+
+    def subtree(self, url):
+        """
+        Returns every page below `url`, not including the page at `url` itself. For a url
+        with no page, that is every page below it by url.
+        """
+        key = url.strip('/')
+        with self.lock:
+            if key in self.pages:
+                stack = self._child_keys(key)
+            else:
+                node = self._node(key)
+                stack = [] if node is None else list(self._all_below(node))
+            seen = set([key])
+            result = []
+            while stack:
+                child = stack.pop()
+                if child in seen or child not in self.pages:
+                    continue
+                seen.add(child)
+                result.append(self.pages[child])
+                stack.extend(self._child_keys(child))
+        return sorted(result, key=lambda p: p['url'])
+
+    def _all_below(self, node):
+        stack = list(node.children.values())
+        while stack:
+            node = stack.pop()
+            if node.url is not None:
+                yield node.url
+            stack.extend(node.children.values())
+
+    def prefix(self, prefix):
+        """
+        Returns every page whose url starts with `prefix`, e.g. "blog/2016-".
+        """
+        prefix = prefix.lstrip('/')
+        segments = prefix.split('/')
+        partial = segments.pop()
+        with self.lock:
+            node = self._node('/'.join(segments))
+            if node is None:
+                return []
+
+            result = []
+            for segment, child in node.children.items():
+                if segment.startswith(partial):
+                    if child.url is not None:
+                        result.append(self.pages[child.url])
+                    result.extend(self.pages[k] for k in self._all_below(child))
+            if not partial and node.url is not None and node.url.startswith(prefix.strip('/')):
+                result.append(self.pages[node.url])
+        return sorted(result, key=lambda p: p['url'])
+
+    def save(self, path):
+        with self.lock:
+            pages = list(self.pages.values())
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as fb:
+            json.dump(pages, fb)
+        replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as fb:
+            return cls(json.load(fb))
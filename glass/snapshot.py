@@ -0,0 +1,261 @@
+import os, os.path, io, copy, json, hashlib, mimetypes, shutil, tarfile, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging
+import requests
+from .pages import PageIndex
+
+logger = logging.getLogger()
+
+INDEX_NAME = 'index.json'
+CHUNK_SIZE = 64 * 1024
+# Downloads larger than this are spooled to disk instead of memory while they are hashed.
+SPOOL_SIZE = 4 * 1024 * 1024
+
+
+def json_sha(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def data_key(record):
+    """
+    Sha of a data record without the fields the server assigns, so the same record can be
+    recognised on a site where it was created with a different id.
+    """
+    return json_sha(dict((k, v) for k, v in record.items() if k not in ('id', 'created', 'modified')))
+
+
+def _required(value, name):
+    # site_req logs and returns None when a response isn't json.
+    if value is None:
+        raise ValueError('Could not read {} from the site'.format(name))
+    return value
+
+
+def _add_bytes(tar, name, buffer):
+    info = tarfile.TarInfo(name)
+    info.size = len(buffer)
+    info.mtime = time.time()
+    tar.addfile(info, io.BytesIO(buffer))
+
+
+def _add_json(tar, name, obj):
+    _add_bytes(tar, name, json.dumps(obj, sort_keys=True).encode('utf-8'))
+
+
+def snapshot(glass, fileobj, echo=logger.info):
+    """
+    Writes settings, files, pages and data records for the site to `fileobj` as a gzipped tar
+    stream. Files are stored once per sha under files/, and index.json (the last member) maps
+    every remote path to its sha. Raises if anything can't be read, rather than writing an
+    incomplete archive.
+    """
+    glass = copy.copy(glass)
+    glass.raise_errors = True
+
+    index = {
+        "version": 1,
+        "domain": glass.domain,
+        "settings": "settings.json",
+        "files": {},
+        "pages": [],
+        "data": [],
+    }
+    blobs = set()
+
+    with tarfile.open(fileobj=fileobj, mode='w|gz') as tar:
+        _add_json(tar, index['settings'], _required(glass.get_settings(), 'settings'))
+
+        for f in glass.iter_files():
+            path = f['path']
+            sha = f.get('sha')
+            if sha and sha in blobs:
+                echo('Skipping File: {} - duplicate of {}'.format(path, sha))
+                index['files'][path] = sha
+                continue
+
+            echo('Getting File: {}'.format(path))
+            resp = glass.get_site_resource(path, stream=True)
+            content_sha = hashlib.sha1()
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+                try:
+                    resp.raise_for_status()
+                    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            content_sha.update(chunk)
+                            spool.write(chunk)
+                finally:
+                    resp.close()
+
+                sha = content_sha.hexdigest()
+                if sha not in blobs:
+                    info = tarfile.TarInfo('files/{}'.format(sha))
+                    info.size = spool.tell()
+                    info.mtime = time.time()
+                    spool.seek(0)
+                    tar.addfile(info, spool)
+                    blobs.add(sha)
+            index['files'][path] = sha
+
+        # Parents come before their children, so restore can create them in order.
+        page_index = PageIndex(_required(glass.list_pages(), 'pages'))
+        depths = dict((p['url'], page_index.depth(p['url'])) for p in page_index)
+        for n, p in enumerate(sorted(page_index, key=lambda p: (depths[p['url']], p['url']))):
+            url = p['url'].lstrip('/')
+            parent = page_index.parent(url)
+            echo('Getting Page: {}'.format(url))
+            page = _required(glass.get_page(url), 'page {}'.format(url))
+            name = 'pages/{}.json'.format(n)
+            _add_json(tar, name, page)
+            index['pages'].append({
+                "url": url,
+                "parent": parent['url'].lstrip('/') if parent else None,
+                "depth": depths[p['url']],
+                "member": name,
+                "sha": json_sha(page),
+            })
+
+        for record in _required(glass.query_data(), 'data'):
+            name = 'data/{}.json'.format(record['id'])
+            _add_json(tar, name, record)
+            index['data'].append({
+                "id": record['id'],
+                "member": name,
+                "sha": json_sha(record),
+                "key": data_key(record),
+            })
+
+        _add_json(tar, INDEX_NAME, index)
+
+    return index
+
+
+def restore(glass, path, workers=8, echo=logger.info):
+    """
+    Replays a snapshot written by `snapshot` onto the site, skipping any file, page or data
+    record whose remote sha already matches. Returns the list of paths, page urls and data
+    ids that failed.
+
+    Data records are only updated in place when restoring onto the site the snapshot was
+    taken from. Anywhere else they are created with new ids, and records whose contents
+    already exist on the site are skipped, so running restore again doesn't duplicate them.
+    """
+    failures = []
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    tmp_dir = tempfile.mkdtemp()
+
+    glass = copy.copy(glass)
+    glass.raise_errors = True
+
+    def _submit(pool, names, func, *args):
+        def _done(future):
+            in_flight.release()
+            if future.exception() is not None:
+                logger.error('Error restoring {}'.format(', '.join(str(n) for n in names)),
+                             exc_info=future.exception())
+                failures.extend(names)
+
+        in_flight.acquire()
+        future = pool.submit(func, *args)
+        future.add_done_callback(_done)
+        return future
+
+    def _put_blob(blob_path, paths):
+        try:
+            for remote_path in paths:
+                echo('Putting File: {}'.format(remote_path))
+                try:
+                    with open(blob_path, 'rb') as fb:
+                        if glass.put_file(remote_path, fb, mimetypes.guess_type(remote_path)[0]):
+                            continue
+                except Exception:
+                    logger.error('Error restoring {}'.format(remote_path), exc_info=True)
+                failures.append(remote_path)
+        finally:
+            os.remove(blob_path)
+
+    def _put_page(url, parent, sha, buffer, exists):
+        if exists and json_sha(glass.get_page(url)) == sha:
+            echo('Skipping Page: {} - contents match'.format(url))
+            return
+        echo('Putting Page: {}'.format(url))
+        page = json.loads(buffer.decode('utf-8'))
+        if not exists:
+            glass.new_page(url, parent=parent)
+        glass.put_page(url, page)
+
+    def _put_data(id, record, exists):
+        echo('Putting Data: {}'.format(id))
+        if exists:
+            glass.put_data(id, record)
+        else:
+            glass.create_data(id, dict((k, v) for k, v in record.items() if k != 'id'))
+
+    try:
+        with tarfile.open(path, 'r:gz') as tar, ThreadPoolExecutor(max_workers=workers) as pool:
+            # index.json is the last member, so this decompresses the whole archive once. The
+            # loop below then starts again from the beginning and reads it forwards once more.
+            index = json.loads(tar.extractfile(INDEX_NAME).read().decode('utf-8'))
+            same_site = index.get('domain') == glass.domain
+
+            # Restoring onto a different site must not rename it.
+            settings = json.loads(tar.extractfile(index['settings']).read().decode('utf-8'))
+            remote_settings = _required(glass.get_settings(), 'settings')
+            settings['domain'] = remote_settings.get('domain', settings.get('domain'))
+            if json_sha(settings) != json_sha(remote_settings):
+                echo('Putting Settings')
+                try:
+                    glass.put_settings(settings)
+                except requests.RequestException:
+                    logger.error('Error restoring settings', exc_info=True)
+                    failures.append('settings')
+
+            remote_files = glass.list_files_compact()
+            paths_by_sha = {}
+            for remote_path, sha in index['files'].items():
+                if remote_files.sha(remote_path) == sha:
+                    echo('Skipping File: {} - contents match'.format(remote_path))
+                    continue
+                paths_by_sha.setdefault(sha, []).append(remote_path)
+
+            remote_pages = set(p['url'].lstrip('/') for p in _required(glass.list_pages(), 'pages'))
+            remote_records = _required(glass.query_data(), 'data')
+            remote_data = dict((r['id'], json_sha(r)) for r in remote_records) if same_site else {}
+            remote_keys = set(data_key(r) for r in remote_records)
+            pages = dict((p['member'], p) for p in index['pages'])
+            data = dict((d['member'], d) for d in index['data'])
+
+            page_futures = []
+            page_depth = 0
+            for member in tar:
+                if member.name.startswith('files/'):
+                    sha = member.name[len('files/'):]
+                    if sha not in paths_by_sha:
+                        continue
+                    blob_path = os.path.join(tmp_dir, sha)
+                    with open(blob_path, 'wb') as fb:
+                        shutil.copyfileobj(tar.extractfile(member), fb, CHUNK_SIZE)
+                    _submit(pool, paths_by_sha[sha], _put_blob, blob_path, paths_by_sha[sha])
+
+                elif member.name in pages:
+                    entry = pages[member.name]
+                    # Pages are stored parents first; let each level finish before the next
+                    # one starts, so no page is created before its parent.
+                    if entry['depth'] != page_depth:
+                        wait(page_futures)
+                        page_futures = []
+                        page_depth = entry['depth']
+                    page_futures.append(_submit(
+                        pool, [entry['url']], _put_page, entry['url'], entry['parent'], entry['sha'],
+                        tar.extractfile(member).read(), entry['url'] in remote_pages))
+
+                elif member.name in data:
+                    entry = data[member.name]
+                    if remote_data.get(entry['id']) == entry['sha'] or entry['key'] in remote_keys:
+                        echo('Skipping Data: {} - contents match'.format(entry['id']))
+                        continue
+                    record = json.loads(tar.extractfile(member).read().decode('utf-8'))
+                    _submit(pool, [entry['id']], _put_data, entry['id'], record, entry['id'] in remote_data)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return failures
@@ -54,5 +54,9 @@ setup(
         'pathspec==0.3.4',
         'watchdog==0.8.3',
     ],
+    extras_require={
+        ':python_version < "3"': ['futures'],
+        'optimize': ['rcssmin', 'rjsmin', 'Pillow'],
+    },
     long_description=readme + '\n\n' + history,
 )
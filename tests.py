@@ -1,21 +1,33 @@
 #!/usr/bin/env python
-from glass import Glass
+from glass import Glass, FileListing, PageIndex
+from glass.files import iter_json_array
+from glass.optimize import Optimizer, minify_css, optimize_png
+from glass.snapshot import snapshot, restore
 from io import StringIO
 from os import environ
 import datetime
+import hashlib
+import io
 import json
 import os.path
 import uuid
 import unittest
 import re
 import requests
+import shutil
 import sys
+import tempfile
 
 try:
     from urllib.parse import urlparse
 except ImportError: #py2
     from urlparse import urlparse
 
+try:
+    from unittest import mock
+except ImportError: #py2
+    import mock
+
 
 class APITests(unittest.TestCase):
 
@@ -104,6 +116,351 @@ class APITests(unittest.TestCase):
         self.assertTrue(found)
 
 
+class OptimizerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_minify_css(self):
+        css = b'/* comment */\na > b ,\nc {\n  color: red;\n  content: "a  ;  b";\n}\n'
+        self.assertEqual(minify_css(css), b'a>b,c{color:red;content:"a  ;  b"}')
+
+    def test_cache(self):
+        calls = []
+
+        def processor(buffer):
+            calls.append(buffer)
+            return buffer[:1]
+
+        local_path = os.path.join(self.path, 'style.css')
+        with open(local_path, 'wb') as fb:
+            fb.write(b'abc')
+
+        optimizer = Optimizer(self.path, {'text/css': processor})
+        self.assertEqual(optimizer.process(local_path, 'text/css'), b'a')
+        self.assertEqual(optimizer.process(local_path, 'text/css'), b'a')
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(optimizer.process(local_path, 'image/jpeg'))
+
+        # A new version of the processor doesn't reuse the old result, and replaces it.
+        processor.version = 2
+        self.assertEqual(optimizer.process(local_path, 'text/css'), b'a')
+        self.assertEqual(len(calls), 2)
+        cache_path = os.path.join(self.path, '.glass', 'optimized')
+        path_dirs = os.listdir(cache_path)
+        self.assertEqual(len(path_dirs), 1)
+        self.assertEqual(len(os.listdir(os.path.join(cache_path, path_dirs[0]))), 1)
+
+    def test_png_16_bit_skipped(self):
+        ihdr = b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\x0dIHDR' + b'\x00\x00\x00\x01' * 2 + b'\x10\x02'
+        with mock.patch('glass.optimize.Image') as image:
+            self.assertIsNone(optimize_png(ihdr + b'\x00' * 20))
+            self.assertFalse(image.open.called)
+
+    def test_prune(self):
+        optimizer = Optimizer(self.path, {'text/css': lambda buffer: buffer[:1]})
+        for name in ('a.css', 'b.css'):
+            with open(os.path.join(self.path, name), 'wb') as fb:
+                fb.write(b'abc')
+            optimizer.process(os.path.join(self.path, name), 'text/css')
+
+        cache_path = os.path.join(self.path, '.glass', 'optimized')
+        self.assertEqual(len(os.listdir(cache_path)), 2)
+        optimizer.prune([os.path.join(self.path, 'a.css')])
+        self.assertEqual(len(os.listdir(cache_path)), 1)
+        self.assertEqual(optimizer.process(os.path.join(self.path, 'a.css'), 'text/css'), b'a')
+
+    def test_skipped_not_cached(self):
+        local_path = os.path.join(self.path, 'app.js')
+        with open(local_path, 'wb') as fb:
+            fb.write(b'var a = 1;')
+
+        optimizer = Optimizer(self.path, {'text/javascript': lambda buffer: None})
+        self.assertIsNone(optimizer.process(local_path, 'text/javascript'))
+
+        optimizer.processors['text/javascript'] = lambda buffer: b'var a=1;'
+        self.assertEqual(optimizer.process(local_path, 'text/javascript'), b'var a=1;')
+
+
+class FileListingTests(unittest.TestCase):
+
+    def test_iter_json_array(self):
+        records = [{"path": "a/\u00e9.css", "sha": "0" * 40, "size": 3}, {"path": "b", "sha": None}, {"path": "c"}]
+        buffer = json.dumps(records, ensure_ascii=False, indent=2).encode('utf-8')
+        for chunk_size in (1, 7, len(buffer)):
+            chunks = [buffer[i:i + chunk_size] for i in range(0, len(buffer), chunk_size)]
+            self.assertEqual(list(iter_json_array(chunks)), records)
+
+        self.assertEqual(list(iter_json_array([b' [ ] '])), [])
+        for malformed in (b'[{"path": "a"}, {"pa', b'[{"a": 1} {"b": 2}]', b'[{"a": 1},,{"b": 2}]',
+                          b'[{"a": 1},]', b'[,{"a": 1}]', b'{"a": 1}', b'[{"a": 1}'):
+            with self.assertRaises(ValueError):
+                list(iter_json_array([malformed]))
+
+    def test_listing(self):
+        sha = hashlib.sha1(b'a').hexdigest()
+        listing = FileListing.from_records([
+            {"path": "a.css", "sha": sha, "size": 1},
+            {"path": "b.css", "sha": "not-a-sha"},
+        ])
+        self.assertEqual(len(listing), 2)
+        self.assertEqual(list(listing), ["a.css", "b.css"])
+        self.assertEqual(listing.get("a.css"), {"path": "a.css", "sha": sha, "size": 1})
+        self.assertEqual(listing.sha("b.css"), "not-a-sha")
+        self.assertIsNone(listing.size("b.css"))
+        self.assertIsNone(listing.get("c.css"))
+
+        listing.add("b.css", sha, 1)
+        self.assertEqual(listing.get("b.css"), {"path": "b.css", "sha": sha, "size": 1})
+
+    def test_iter_files_errors(self):
+        glass = Glass('user@example.com', 'password', 'example')
+        with mock.patch('glass.client.requests.request') as request:
+            request.return_value = mock.Mock(status_code=500)
+            with self.assertRaises(requests.HTTPError):
+                glass.list_files_compact()
+
+            request.return_value = mock.Mock(status_code=200, iter_content=lambda chunk_size: [b'[{"path": "a"},'])
+            with self.assertRaises(ValueError):
+                glass.list_files_compact()
+
+
+class PageIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PageIndex([
+            {"url": "/"},
+            {"url": "blog/"},
+            {"url": "blog/2016/first"},
+            {"url": "blog/2016/second"},
+            {"url": "blog/2017-post"},
+            {"url": "about"},
+        ])
+
+    def test_lookup(self):
+        self.assertEqual(self.index.get("/blog")["url"], "blog/")
+        self.assertIn("about/", self.index)
+        self.assertIsNone(self.index.get("missing"))
+        self.assertEqual(self.index.parent("blog/2016/first")["url"], "blog/")
+
+    def test_tree(self):
+        urls = lambda pages: [p["url"] for p in pages]
+        self.assertEqual(urls(self.index.children("blog")),
+                         ["blog/2016/first", "blog/2016/second", "blog/2017-post"])
+        self.assertEqual(urls(self.index.subtree("blog/2016")), ["blog/2016/first", "blog/2016/second"])
+        self.assertEqual(urls(self.index.prefix("blog/201")),
+                         ["blog/2016/first", "blog/2016/second", "blog/2017-post"])
+        self.assertEqual(urls(self.index.prefix("blog/2017")), ["blog/2017-post"])
+
+    def test_update_and_persist(self):
+        self.index.update("blog/2016/first", {"title": "First"})
+        self.index.remove("about")
+        path = os.path.join(tempfile.mkdtemp(), 'pages.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.index.save(path)
+
+        loaded = PageIndex.load(path)
+        self.assertEqual(len(loaded), 5)
+        self.assertEqual(loaded.get("blog/2016/first")["title"], "First")
+        self.assertNotIn("about", loaded)
+
+    def test_declared_parent(self):
+        self.index.add({"url": "news/launch", "parent": "blog/2016/"})
+        urls = lambda pages: [p["url"] for p in pages]
+        self.assertEqual(self.index.parent("news/launch")["url"], "blog/")
+        self.assertEqual(self.index.depth("news/launch"), 2)
+        self.assertIn("news/launch", urls(self.index.subtree("blog")))
+
+        self.index.add({"url": "blog/2016/"})
+        self.assertEqual(self.index.parent("news/launch")["url"], "blog/2016/")
+        self.assertEqual(urls(self.index.children("blog/2016")),
+                         ["blog/2016/first", "blog/2016/second", "news/launch"])
+
+    def test_self_parent(self):
+        self.index.add({"url": "blog/2016/first", "parent": "blog/2016/first/"})
+        self.assertEqual(self.index.parent("blog/2016/first")["url"], "blog/")
+        self.assertIn("blog/2016/first", [p["url"] for p in self.index.children("blog")])
+
+    def test_glass_updates(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        os.mkdir(os.path.join(path, '.glass'))
+        glass = Glass('user@example.com', 'password', 'example', config_path=path)
+
+        def response(status_code, body):
+            return mock.Mock(status_code=status_code, json=mock.Mock(return_value=body))
+
+        with mock.patch('glass.client.requests.request') as request:
+            request.return_value = response(200, [{"url": "blog/"}])
+            glass.load_page_index()
+
+            request.return_value = response(500, {"error": "nope"})
+            glass.new_page("blog/failed")
+            glass.put_page("blog/", {"title": "Failed"})
+            self.assertNotIn("blog/failed", glass.page_index)
+            self.assertNotIn("title", glass.page_index.get("blog/"))
+
+            request.return_value = response(200, {"url": "blog/post", "title": "Post"})
+            glass.new_page("blog/post", title="Post")
+            self.assertEqual(PageIndex.load(glass.page_index_path()).get("blog/post")["title"], "Post")
+
+            # Without a loaded index, the saved one is thrown away rather than left stale.
+            glass.page_index = None
+            glass.put_page("blog/post", {"title": "Changed"})
+            self.assertFalse(os.path.exists(glass.page_index_path()))
+
+
+class FakeResponse(object):
+
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('{} response'.format(self.status_code))
+
+    def close(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+
+class FakeGlass(object):
+    """
+    In-memory stand-in for `Glass`, for testing commands without a live site.
+    """
+
+    def __init__(self, files=None, pages=None, data=None, settings=None, domain='fake'):
+        self.domain = domain
+        self.files = files or {}
+        self.pages = pages or {}
+        self.data = data or {}
+        self.settings = settings or {"domain": self.domain}
+        self.calls = []
+
+    def get_settings(self):
+        return dict(self.settings)
+
+    def put_settings(self, settings):
+        self.calls.append(('put_settings',))
+        self.settings.clear()
+        self.settings.update(settings)
+
+    def list_files(self):
+        return [{"path": path, "sha": hashlib.sha1(content).hexdigest()} for path, content in self.files.items()]
+
+    def iter_files(self):
+        return iter(self.list_files())
+
+    def list_files_compact(self):
+        return FileListing.from_records(self.list_files())
+
+    def get_site_resource(self, path, **kwargs):
+        if path not in self.files:
+            return FakeResponse(b'<h1>Not Found</h1>', 404)
+        return FakeResponse(self.files[path])
+
+    def put_file(self, path, buffer, content_type="text/plain"):
+        self.calls.append(('put_file', path))
+        self.files[path] = buffer.read()
+        return {"path": path}
+
+    def list_pages(self):
+        return [{"url": url} for url in self.pages]
+
+    def new_page(self, url, parent=None, **kwargs):
+        self.calls.append(('new_page', url))
+        if parent is not None and parent not in self.pages:
+            raise requests.HTTPError('Parent {} does not exist'.format(parent))
+        self.pages[url] = {"url": url}
+
+    def get_page(self, path):
+        return self.pages[path]
+
+    def put_page(self, path, data):
+        self.calls.append(('put_page', path))
+        if data.get('fail'):
+            raise requests.HTTPError('500 response for {}'.format(path))
+        self.pages[path] = data
+
+    def query_data(self, **kwargs):
+        return list(self.data.values())
+
+    def put_data(self, id, data):
+        self.calls.append(('put_data', id))
+        self.data[id] = data
+
+    def create_data(self, id, data):
+        # Like the real API, the server picks the id.
+        self.calls.append(('create_data', id))
+        new_id = max(self.data or [0]) + 1
+        self.data[new_id] = dict(data, id=new_id)
+
+
+class SnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.archive = os.path.join(self.path, 'site.tar.gz')
+
+    def test_round_trip(self):
+        source = FakeGlass(
+            files={"a.css": b"a{}", "b.css": b"a{}", "img/c.png": b"png"},
+            pages={
+                "blog/post": {"url": "blog/post", "content": {"title": "Post"}},
+                "blog/": {"url": "blog/", "content": {"title": "Blog"}},
+            },
+            data={1: {"id": 1, "bucket": "x"}, 2: {"id": 2, "bucket": "y"}},
+            settings={"domain": "fake", "name": "Fake"},
+        )
+        with open(self.archive, 'wb') as fb:
+            index = snapshot(source, fb, echo=lambda msg: None)
+        self.assertEqual(len(set(index['files'].values())), 2)
+
+        target = FakeGlass(
+            files={"a.css": b"a{}"}, data={1: {"id": 1, "bucket": "z"}}, settings={"domain": "other"}, domain='other')
+        self.assertEqual(restore(target, self.archive, workers=2, echo=lambda msg: None), [])
+
+        self.assertEqual(target.files, source.files)
+        self.assertEqual(target.pages, source.pages)
+        # Records get new ids on another site, and don't overwrite the ones already there.
+        self.assertEqual(sorted(r['bucket'] for r in target.data.values()), ['x', 'y', 'z'])
+        self.assertEqual(target.settings, {"domain": "other", "name": "Fake"})
+        self.assertNotIn(('put_file', 'a.css'), target.calls)
+
+        # Nothing left to do the second time around.
+        target.calls = []
+        restore(target, self.archive, echo=lambda msg: None)
+        self.assertEqual(target.calls, [])
+
+    def test_snapshot_errors(self):
+        source = FakeGlass(files={"a.css": b"a{}"})
+        source.list_files = lambda: [{"path": "a.css"}, {"path": "missing.css"}]
+        with open(self.archive, 'wb') as fb:
+            with self.assertRaises(requests.HTTPError):
+                snapshot(source, fb, echo=lambda msg: None)
+
+        source = FakeGlass()
+        source.list_pages = lambda: None
+        with open(self.archive, 'wb') as fb:
+            with self.assertRaises(ValueError):
+                snapshot(source, fb, echo=lambda msg: None)
+
+    def test_failures(self):
+        source = FakeGlass(pages={"a": {"url": "a", "fail": True}, "b": {"url": "b"}})
+        with open(self.archive, 'wb') as fb:
+            snapshot(source, fb, echo=lambda msg: None)
+
+        target = FakeGlass()
+        self.assertEqual(restore(target, self.archive, echo=lambda msg: None), ["a"])
+        self.assertEqual(list(target.pages), ["a", "b"])
+
+
 if __name__ == '__main__':
     python_version = sys.version_info[0]
     if python_version < 3: